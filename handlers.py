@@ -1,7 +1,12 @@
+import asyncio
+import contextlib
 import functools
+import hashlib
 import logging
 import os
+import time
 from math import ceil
+from typing import Callable
 
 import aiohttp
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
@@ -18,6 +23,9 @@ import storage
 logger = logging.getLogger(__name__)
 
 PAGE_SIZE = 8
+REFRESH_QUEUE_SIZE = 4      # сколько готовых ответов может ждать разбора в очереди
+PROGRESS_INTERVAL = 2.0     # сек между правками сообщения о прогрессе (flood limit)
+REPORT_MAX_LINES = 30       # строк отчёта по источникам в итоговом сообщении
 
 # ---------------------------------------------------------------------------
 # Helpers
@@ -41,19 +49,95 @@ def admin_only(func):
     return wrapper
 
 
-async def _do_refresh(urls: list[str]) -> tuple[int, int]:
-    """Fetch + parse + upsert. Возвращает (total_locations, failed_urls)."""
-    results = await sub_parser.fetch_all(urls)
+def _short_url(url: str) -> str:
+    return url[:40] + "…" if len(url) > 40 else url
+
+
+ProgressCallback = Callable[[int, int, int], None]
+
+
+async def _do_refresh(
+    urls: list[str],
+    on_progress: ProgressCallback | None = None,
+) -> tuple[int, int, list[str]]:
+    """
+    Fetch → parse → upsert конвейером. Все fetch идут параллельно; каждый
+    источник разбирается и сохраняется, как только готов его ответ, не дожидаясь
+    самого медленного. Медленный разбор или ожидание storage задерживает только
+    выдачу уже скачанных ответов, но не сами загрузки, поэтому время refresh ≈
+    самый медленный fetch + разбор того, что осталось в очереди после него.
+    on_progress(done, total_urls, total_locations) вызывается после каждого
+    источника и не должен блокировать (см. _ProgressEditor).
+    Возвращает (total_locations, failed_urls, отчёт по источникам); строки отчёта
+    идут в порядке завершения fetch, а не в порядке urls.
+    """
+    loop = asyncio.get_running_loop()
     total = 0
     failed = 0
-    for url, text in results:
-        if text is None:
-            failed += 1
-            continue
-        locs = sub_parser.parse_configs(text, url)
-        await storage.upsert_locations_bulk(locs)
-        total += len(locs)
-    return total, failed
+    done = 0
+    report: list[str] = []
+    async with contextlib.aclosing(sub_parser.iter_fetch(urls, REFRESH_QUEUE_SIZE)) as results:
+        async for url, text in results:
+            done += 1
+            if text is None:
+                failed += 1
+                report.append(f"❌ {_short_url(url)}: ошибка fetch")
+            else:
+                # Разбор в executor, чтобы не блокировать приём остальных ответов
+                locs = await loop.run_in_executor(None, sub_parser.parse_configs, text, url)
+                await storage.upsert_locations_bulk(locs)
+                total += len(locs)
+                report.append(f"✅ {_short_url(url)}: {len(locs)}")
+            if on_progress is not None:
+                on_progress(done, len(urls), total)
+    return total, failed, report
+
+
+class _ProgressEditor:
+    """
+    on_progress для _do_refresh: правит msg в фоне не чаще PROGRESS_INTERVAL
+    и пропускает обновление, пока предыдущая правка ещё не завершилась.
+    """
+
+    def __init__(self, msg, title: str):
+        self._msg = msg
+        self._title = title
+        self._last_edit = time.monotonic()
+        self._task: asyncio.Task | None = None
+
+    def __call__(self, done: int, total_urls: int, total_locations: int) -> None:
+        if done == total_urls or (self._task is not None and not self._task.done()):
+            return
+        now = time.monotonic()
+        if now - self._last_edit < PROGRESS_INTERVAL:
+            return
+        self._last_edit = now
+        self._task = asyncio.create_task(self._edit(
+            f"{self._title} {done}/{total_urls} источников, локаций: {total_locations}"
+        ))
+
+    async def _edit(self, text: str) -> None:
+        try:
+            await self._msg.edit_text(text)
+        except Exception as e:
+            logger.debug("Не удалось обновить прогресс: %s", e)
+
+    async def wait(self) -> None:
+        """Дождаться незавершённой правки, чтобы она не перезаписала итог."""
+        if self._task is not None:
+            await self._task
+
+
+def _refresh_summary(header: str, failed: int, report: list[str]) -> str:
+    text = header
+    if failed:
+        text += f"\n⚠️ Ошибок fetch: {failed}"
+    if report:
+        lines = report[:REPORT_MAX_LINES]
+        if len(report) > REPORT_MAX_LINES:
+            lines.append(f"… и ещё {len(report) - REPORT_MAX_LINES}")
+        text += "\n\n" + "\n".join(lines)
+    return text
 
 
 def _locations_keyboard(locations: dict, page: int) -> InlineKeyboardMarkup:
@@ -93,12 +177,10 @@ def _locations_keyboard(locations: dict, page: int) -> InlineKeyboardMarkup:
 
 
 def _subs_keyboard(urls: list[str]) -> InlineKeyboardMarkup:
-    import hashlib
     rows = []
     for url in urls:
         uid = hashlib.md5(url.encode()).hexdigest()
-        short = url[:40] + "…" if len(url) > 40 else url
-        rows.append([InlineKeyboardButton(f"🗑 {short}", callback_data=f"remove_sub:{uid}")])
+        rows.append([InlineKeyboardButton(f"🗑 {_short_url(url)}", callback_data=f"remove_sub:{uid}")])
     return InlineKeyboardMarkup(rows)
 
 
@@ -137,7 +219,7 @@ async def cmd_addsub(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     msg = await update.message.reply_text("⏳ Получаю локации…")
-    total, failed = await _do_refresh([url])
+    total, failed, _ = await _do_refresh([url])
     text = f"✅ Добавлено. Найдено {total} локаций."
     if failed:
         text += f"\n⚠️ Ошибок fetch: {failed}"
@@ -161,10 +243,15 @@ async def cmd_refresh(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Нет источников. Добавьте через /addsub <url>")
         return
     msg = await update.message.reply_text("⏳ Обновляю…")
-    total, failed = await _do_refresh(urls)
-    text = f"✅ Обновлено. Локаций: {total}."
-    if failed:
-        text += f"\n⚠️ Ошибок fetch: {failed}"
+    progress = _ProgressEditor(msg, "⏳ Обновляю…")
+    try:
+        total, failed, report = await _do_refresh(urls, progress)
+        text = _refresh_summary(f"✅ Обновлено. Локаций: {total}.", failed, report)
+    except Exception as e:
+        logger.exception("Ошибка refresh")
+        text = f"❌ Ошибка обновления: {e}"
+    finally:
+        await progress.wait()
     await msg.edit_text(text)
 
 
@@ -260,7 +347,6 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif data.startswith("remove_sub:"):
         uid = data[len("remove_sub:"):]
-        import hashlib
         urls = await storage.get_sub_urls()
         target = next((u for u in urls if hashlib.md5(u.encode()).hexdigest() == uid), None)
         if target:
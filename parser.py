@@ -1,6 +1,7 @@
+import asyncio
 import hashlib
 import logging
-from typing import Any
+from typing import Any, AsyncIterator
 
 import aiohttp
 
@@ -76,13 +77,27 @@ async def fetch_one(session: aiohttp.ClientSession, url: str) -> tuple[str, str
         return url, None
 
 
-async def fetch_all(urls: list[str]) -> list[tuple[str, str | None]]:
-    """Конкурентный fetch всех URLs. Возвращает список (url, text | None)."""
-    import asyncio
-
+async def iter_fetch(urls: list[str], maxsize: int = 4) -> AsyncIterator[tuple[str, str | None]]:
+    """
+    Конкурентный fetch всех URLs с выдачей (url, text | None) по мере готовности.
+    Все fetch стартуют сразу, как и раньше. Готовые результаты проходят через
+    очередь на maxsize элементов: когда она заполнена, воркер с уже скачанным
+    ответом ждёт потребителя, но остальные загрузки продолжаются.
+    """
     if not urls:
-        return []
+        return
+
+    queue: asyncio.Queue[tuple[str, str | None]] = asyncio.Queue(maxsize=maxsize)
 
     async with aiohttp.ClientSession() as session:
-        tasks = [fetch_one(session, url) for url in urls]
-        return await asyncio.gather(*tasks)
+        async def _worker(url: str) -> None:
+            await queue.put(await fetch_one(session, url))
+
+        tasks = [asyncio.create_task(_worker(url)) for url in urls]
+        try:
+            for _ in urls:
+                yield await queue.get()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)